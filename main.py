@@ -1,16 +1,19 @@
 import hashlib
-import subprocess
+import json
 import os
 import logging
+import queue
 import threading
 import time
 import argparse
 import dotenv
+import psutil
 
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
 from dataclasses import dataclass
 from selenium.webdriver.firefox.options import Options as FirefoxOptions
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from rich.progress import Progress
 from rich.logging import RichHandler
 
@@ -21,18 +24,64 @@ AUTH_INFO = {
     "password": os.environ.get("LEARNUS_PASSWORD"),
 }
 
+# pids of the geckodriver processes started by this run, also kept on disk so
+# that the next run can clean up after a crash
+PID_FILE = ".learnus-bot.pids"
+# links of the vods played to the end, so a later run can skip them even if
+# learnus hasn't marked them as complete yet
+COMPLETED_VODS_FILE = ".learnus-bot.completed.json"
+
 from selenium import webdriver
+from selenium.webdriver.common.alert import Alert
 from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common.exceptions import (
     NoAlertPresentException,
-    NoSuchElementException,
+    TimeoutException,
     UnexpectedAlertPresentException,
+    WebDriverException,
 )
 
 logger = logging.getLogger(__name__)
 logger.addHandler(RichHandler(rich_tracebacks=True))
 logger.setLevel("DEBUG")
 
+# seconds to wait for an element before giving up
+ELEMENT_WAIT_TIMEOUT = 10
+# seconds to wait for the dashboard after submitting the login form
+LOGIN_WAIT_TIMEOUT = 15
+# seconds between progress checks while a vod is playing, the actual interval
+# adapts to the expected remaining time within these bounds
+PROGRESS_POLL_INTERVAL = 5
+PROGRESS_POLL_MAX_INTERVAL = 60
+# number of vods downloaded at once, and segments fetched at once per vod
+DOWNLOAD_THREADS = 4
+DOWNLOAD_SEGMENT_POOLSIZE = 16
+# firefox instances starting at the same time, and attempts before giving up
+DRIVER_LAUNCH_CONCURRENCY = 2
+DRIVER_LAUNCH_RETRIES = 5
+
+# selectors
+SEL_LOGIN_USERNAME = (By.CSS_SELECTOR, 'input[name="username"]')
+SEL_LOGIN_PASSWORD = (By.CSS_SELECTOR, 'input[name="password"]')
+SEL_LOGIN_BUTTON = (By.CSS_SELECTOR, 'input[name="loginbutton"]')
+SEL_LOGGED_IN = (By.CSS_SELECTOR, ".course-box, #page-my-index")
+SEL_PLAY_BTN = (By.CSS_SELECTOR, "#my-video > button")
+SEL_PLAYBACK_RATE_BTN = (By.CSS_SELECTOR, "button.vjs-playback-rate")
+SEL_PLAYBACK_RATE_ITEMS = (
+    By.CSS_SELECTOR,
+    "div.vjs-playback-rate .vjs-menu .vjs-menu-item .vjs-menu-item-text",
+)
+SEL_PROGRESS = (By.CSS_SELECTOR, ".vjs-progress-control div.vjs-progress-holder")
+SEL_VIDEO_SOURCE = (By.CSS_SELECTOR, "video source")
+
+# launching many firefox instances at once intermittently fails, so stagger them
+_driver_launch_semaphore = threading.Semaphore(DRIVER_LAUNCH_CONCURRENCY)
+_spawned_pids: List[int] = []
+_completed_vods_lock = threading.Lock()
+_spawned_pids_lock = threading.Lock()
+
 # types
 @dataclass
 class Course:
@@ -47,51 +96,46 @@ class Vod:
     is_complete: bool
 
 
-def delete_elements(driver, selector: str):
-    driver.execute_script(
-        f"""
-        var elements = document.querySelectorAll('{selector}');
-        for (var i = 0; i < elements.length; i++) {{
-            elements[i].parentNode.removeChild(elements[i]);
-        }}
-    """
-    )
-
-
 def get_all_vods_under_course(driver, course: Course) -> List[Vod]:
     driver.get(course.link)
-    vods: List[Vod] = []
-
-    # get all elements with .course-box
-    vod_elements = driver.find_elements(By.CSS_SELECTOR, ".vod.activity")
 
-    for vod_element in vod_elements:
-        # remove '.accesshide' element
-        delete_elements(driver, ".accesshide")
-        vod_name = vod_element.find_element(By.CSS_SELECTOR, "span.instancename").text
-        vod_link = vod_element.find_element(By.CSS_SELECTOR, "a").get_attribute("href")
+    # read every vod in one round-trip, instead of several find_element calls per vod
+    rows = driver.execute_script(
+        """
+        return Array.from(document.querySelectorAll('.vod.activity')).map(function (v) {
+            var a = v.querySelector('a');
+            var s = v.querySelector('span.instancename');
+            var i = v.querySelector('img.icon');
+            // remove '.accesshide' element, it is appended to the vod name
+            if (s) {
+                s.querySelectorAll('.accesshide').forEach(function (e) { e.remove(); });
+            }
+            return {
+                name: s ? s.innerText : '',
+                href: a ? a.href : null,
+                icon: i ? i.getAttribute('src') : null,
+            };
+        });
+    """
+    )
 
-        try:
-            vod_complete_icon = vod_element.find_element(By.CSS_SELECTOR, "img.icon")
-            is_complete = vod_complete_icon.get_attribute("src").endswith(
-                "completion-auto-y"
-            )
-            vods.append(
-                Vod(
-                    vod_name,
-                    vod_link.replace("view.php", "viewer.php"), # view.php seems to be automatically redirected back to home page, so use viewer.php
-                    is_complete,
-                )
+    # vods without a link or a completion icon can't be played or tracked, so skip them
+    # view.php seems to be automatically redirected back to home page, so use viewer.php
+    # sometimes, the same vod is repeated, so do remove duplicates by using link as key
+    vods = list(
+        {
+            row["href"]: Vod(
+                row["name"],
+                row["href"].replace("view.php", "viewer.php"),
+                row["icon"].endswith("completion-auto-y"),
             )
-            logger.debug(f"\tfound vod: {vod_name} at {vod_link}, is_complete: {is_complete}")
-        except NoSuchElementException as e:
-            ...
+            for row in rows
+            if row["href"] and row["icon"] is not None
+        }.values()
+    )
 
-    # sometimes, the same vod is repeated, so do remove duplicates by using link as key
-    vod_links_set = set()
-    vods = [
-        v for v in vods if not (v.link in vod_links_set or vod_links_set.add(v.link))
-    ]
+    for vod in vods:
+        logger.debug("\tfound vod: %s at %s, is_complete: %s", vod.name, vod.link, vod.is_complete)
 
     return vods
 
@@ -99,106 +143,122 @@ def get_all_vods_under_course(driver, course: Course) -> List[Vod]:
 def parse_time_to_secs(time_str: str) -> int:
     """splits the time string (hh:mm:ss, hh/mm is optional) and returns the time in seconds"""
     time_str_splitted = time_str.split(":")
-    logger.info("timestr", time_str, time_str_splitted)
-
-    if len(time_str_splitted == 1):
-        return int(time_str_splitted[0])
-    elif len(time_str_splitted == 2):
-        return int(time_str_splitted[0]) * 60 + int(time_str_splitted[1])
-    elif len(time_str_splitted == 3):
-        return (
-            int(time_str_splitted[0]) * 3600
-            + int(time_str_splitted[1]) * 60
-            + int(time_str_splitted[2])
-        )
-    else:
-        raise ValueError(f"time_str is not in the correct format: {time_str}")
+    logger.debug("timestr=%s split=%s", time_str, time_str_splitted)
 
+    if not 1 <= len(time_str_splitted) <= 3:
+        raise ValueError(f"time_str is not in the correct format: {time_str}")
 
-def _vod_get_current_progress(driver) -> float:
-    progress_element = driver.find_element(
-        By.CSS_SELECTOR, ".vjs-progress-control div.vjs-progress-holder"
+    parts = [int(part) for part in time_str_splitted]
+    return sum(part * 60**i for i, part in enumerate(reversed(parts)))
+
+
+def _vod_get_current_progress(driver, progress_element) -> float:
+    # compute the ratio in the browser, so each poll is a single round-trip
+    progress = driver.execute_script(
+        """
+        var p = arguments[0];
+        var now = p.getAttribute('aria-valuenow');
+        var min = p.getAttribute('aria-valuemin');
+        var max = p.getAttribute('aria-valuemax');
+        if (now === null || min === null || max === null) {
+            return null;
+        }
+        return (parseFloat(now) - parseFloat(min)) / (parseFloat(max) - parseFloat(min));
+    """,
+        progress_element,
     )
-    value_now = progress_element.get_attribute("aria-valuenow")
-    value_min = progress_element.get_attribute("aria-valuemin")
-    value_max = progress_element.get_attribute("aria-valuemax")
 
-    assert value_now is not None
-    assert value_min is not None
-    assert value_max is not None
+    assert progress is not None
 
-    return (float(value_now) - float(value_min)) / (float(value_max) - float(value_min))
+    return float(progress)
 
 
 def _vod_set_to_highest_playback_rate(driver) -> float:
     # click the playback rate button
-    _vjs_playback_rate_btn = driver.find_element(
-        By.CSS_SELECTOR, "button.vjs-playback-rate"
+    _vjs_playback_rate_btn = WebDriverWait(driver, ELEMENT_WAIT_TIMEOUT).until(
+        EC.element_to_be_clickable(SEL_PLAYBACK_RATE_BTN)
     )
     _vjs_playback_rate_btn.click()
-    # get the highest playback rate
-    vjs_playback_rate_elements = driver.find_elements(
-        By.CSS_SELECTOR,
-        "div.vjs-playback-rate .vjs-menu .vjs-menu-item .vjs-menu-item-text",
+    # get the highest playback rate (the first menu item), once the menu has opened
+    vjs_highest_playback_rate_element = WebDriverWait(driver, ELEMENT_WAIT_TIMEOUT).until(
+        EC.element_to_be_clickable(SEL_PLAYBACK_RATE_ITEMS)
     )
-    vjs_playback_rate_elements[0].click()
+    vjs_highest_playback_rate_element.click()
 
 
 def _vod_confirm_alert_if_exists(driver):
     try:
         alert = driver.switch_to.alert
+        logger.info("alert: %s", alert.text)
         alert.accept()
-        logger.info(f"alert: {alert.text}")
     except NoAlertPresentException:
         ...
 
 
 def _vod_click_play_btn(driver) -> None:
-    play_btn = driver.find_element(By.CSS_SELECTOR, "#my-video > button")
-    play_btn.click()
+    # the "resume from where you left off" alert, if any, shows up before the player is ready
+    play_btn_or_alert = WebDriverWait(driver, ELEMENT_WAIT_TIMEOUT).until(
+        EC.any_of(EC.alert_is_present(), EC.element_to_be_clickable(SEL_PLAY_BTN))
+    )
+    if isinstance(play_btn_or_alert, Alert):
+        _vod_confirm_alert_if_exists(driver)
+        play_btn_or_alert = WebDriverWait(driver, ELEMENT_WAIT_TIMEOUT).until(
+            EC.element_to_be_clickable(SEL_PLAY_BTN)
+        )
+    play_btn_or_alert.click()
 
 
 def play_vod(driver, vod: Vod, course: Course, progress: Progress):
     driver.get(vod.link)
-    time.sleep(1)
-    _vod_confirm_alert_if_exists(driver)
-    time.sleep(1)
     _vod_click_play_btn(driver)
-    time.sleep(1)
     _vod_set_to_highest_playback_rate(driver)
-    time.sleep(1)
 
     task1 = progress.add_task(
         f"at {threading.current_thread().name}>, playing vod {vod.name}", total=10000
     )
 
+    # the progress bar node stays the same for the whole video, so look it up once
+    progress_element = driver.find_element(*SEL_PROGRESS)
+
+    start_time = time.time()
+    start_progress = _vod_get_current_progress(driver, progress_element)
+    poll_interval = PROGRESS_POLL_INTERVAL
+
     while True:
-        time.sleep(1)
-        current_progress = _vod_get_current_progress(driver)
+        time.sleep(poll_interval)
+        current_progress = _vod_get_current_progress(driver, progress_element)
         progress.update(task1, completed=current_progress * 10000)
 
         if current_progress > 0.995:
-            logger.info(f"reached 99.5% of the video, exiting...")
+            logger.info("reached 99.5% of the video, exiting...")
             break
 
+        # sleep for half of the estimated remaining time, the playback rate is fixed
+        rate = (current_progress - start_progress) / (time.time() - start_time)
+        if rate > 0:
+            poll_interval = max(
+                PROGRESS_POLL_INTERVAL,
+                min(PROGRESS_POLL_MAX_INTERVAL, (0.995 - current_progress) / rate * 0.5),
+            )
+        else:
+            poll_interval = PROGRESS_POLL_INTERVAL
+
     time.sleep(1)
 
 
 def _vod_get_video_m3u8_link(driver, vod: Vod):
     try:
         driver.get(vod.link)
-        time.sleep(3)
-        m3u8_link = driver.find_element(By.CSS_SELECTOR, "video source").get_attribute(
-            "src"
+        video_source = WebDriverWait(driver, ELEMENT_WAIT_TIMEOUT).until(
+            EC.presence_of_element_located(SEL_VIDEO_SOURCE)
         )
     except UnexpectedAlertPresentException:
         _vod_confirm_alert_if_exists(driver)
-        time.sleep(1)
+        video_source = WebDriverWait(driver, ELEMENT_WAIT_TIMEOUT).until(
+            EC.presence_of_element_located(SEL_VIDEO_SOURCE)
+        )
 
-    m3u8_link = driver.find_element(By.CSS_SELECTOR, "video source").get_attribute(
-        "src"
-    )
-    return m3u8_link
+    return video_source.get_attribute("src")
 
 
 def do_login(driver, username: str, password: str) -> None:
@@ -206,32 +266,120 @@ def do_login(driver, username: str, password: str) -> None:
     driver.get("https://ys.learnus.org/login/method/sso.php")
 
     # get the input element and type in the username
-    username_btn = driver.find_element(By.CSS_SELECTOR, 'input[name="username"]')
+    username_btn = driver.find_element(*SEL_LOGIN_USERNAME)
     username_btn.send_keys(username)
 
-    password_btn = driver.find_element(By.CSS_SELECTOR, 'input[name="password"]')
+    password_btn = driver.find_element(*SEL_LOGIN_PASSWORD)
     password_btn.send_keys(password)
 
-    login_btn = driver.find_element(By.CSS_SELECTOR, 'input[name="loginbutton"]')
+    login_btn = driver.find_element(*SEL_LOGIN_BUTTON)
     login_btn.click()
 
-    time.sleep(3)
+    # wait until we land on the dashboard and it has been parsed completely, pages
+    # load eagerly so the body id shows up before the course list does
+    try:
+        WebDriverWait(driver, LOGIN_WAIT_TIMEOUT).until(
+            EC.all_of(
+                EC.presence_of_element_located(SEL_LOGGED_IN),
+                lambda d: d.execute_script("return document.readyState") != "loading",
+            )
+        )
+    except TimeoutException:
+        logger.error("login did not complete within %s seconds", LOGIN_WAIT_TIMEOUT)
+        raise
 
 
 def get_all_courses(driver) -> List[Course]:
-    course_boxes = driver.find_elements(By.CSS_SELECTOR, ".course-box")
-    courses: List[Course] = []
+    rows = driver.execute_script(
+        """
+        return Array.from(document.querySelectorAll('.course-box')).map(function (c) {
+            var a = c.querySelector('a.course-link');
+            var h = c.querySelector('.course-title h3');
+            // remove '.semester-name' element, it is part of the title heading
+            if (h) {
+                h.querySelectorAll('.semester-name').forEach(function (e) { e.remove(); });
+            }
+            return {
+                title: h ? h.innerText : '',
+                href: a ? a.href : null,
+            };
+        });
+    """
+    )
+
+    assert all(row["href"] is not None for row in rows)
+
+    return list({row["href"]: Course(row["title"], row["href"]) for row in rows}.values())
+
+
+def _record_spawned_pid(pid: int) -> None:
+    with _spawned_pids_lock:
+        _spawned_pids.append(pid)
+        with open(PID_FILE, "w") as f:
+            f.write("\n".join(str(p) for p in _spawned_pids))
+
+
+def kill_processes(pids: List[int]) -> None:
+    """terminates the given geckodriver processes along with their firefox children"""
+    procs: List[psutil.Process] = []
+    for pid in pids:
+        try:
+            proc = psutil.Process(pid)
+            # the pid may have been reused by an unrelated process since it was recorded
+            if not proc.name().startswith("geckodriver"):
+                continue
+            procs.extend(proc.children(recursive=True))
+            procs.append(proc)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            ...
+
+    for proc in procs:
+        try:
+            proc.terminate()
+        except psutil.NoSuchProcess:
+            ...
+
+    _, alive = psutil.wait_procs(procs, timeout=3)
+    for proc in alive:
+        try:
+            proc.kill()
+        except psutil.NoSuchProcess:
+            ...
+
+
+def kill_previous_run_processes() -> None:
+    if not os.path.exists(PID_FILE):
+        return
 
-    for course_box in course_boxes:
-        course_link_element = course_box.find_element(By.CSS_SELECTOR, "a.course-link")
-        course_link = course_link_element.get_attribute("href")
-        assert course_link is not None
+    with open(PID_FILE) as f:
+        pids = [int(line) for line in f.read().split()]
 
-        delete_elements(driver, ".semester-name")
-        course_title = course_box.find_element(By.CSS_SELECTOR, ".course-title h3").text
-        courses.append(Course(course_title, course_link))
+    logger.info("killing %d processes left over from a previous run...", len(pids))
+    kill_processes(pids)
+    os.remove(PID_FILE)
 
-    return courses
+
+def kill_spawned_processes() -> None:
+    with _spawned_pids_lock:
+        pids = list(_spawned_pids)
+        _spawned_pids.clear()
+
+    kill_processes(pids)
+    if os.path.exists(PID_FILE):
+        os.remove(PID_FILE)
+
+
+def _launch_firefox(options: FirefoxOptions):
+    for attempt in range(DRIVER_LAUNCH_RETRIES):
+        try:
+            with _driver_launch_semaphore:
+                return webdriver.Firefox(options=options)
+        except WebDriverException as e:
+            if attempt == DRIVER_LAUNCH_RETRIES - 1:
+                raise
+            delay = 0.5 * 2**attempt
+            logger.warning("failed to launch firefox (%s), retrying in %.1fs", e, delay)
+            time.sleep(delay)
 
 
 def build_driver(headless: bool = True):
@@ -239,101 +387,265 @@ def build_driver(headless: bool = True):
     options.add_argument("--mute-audio")
     if headless:
         options.add_argument("--headless")
-    driver = webdriver.Firefox(options=options)
+    # only the DOM is needed, so don't wait for (or fetch) images
+    options.page_load_strategy = "eager"
+    options.set_preference("permissions.default.image", 2)
+    # keep each browser in a single content process, there are several of them
+    options.set_preference("dom.ipc.processCount", 1)
+    driver = _launch_firefox(options)
+    _record_spawned_pid(driver.service.process.pid)
     driver.execute_script(
         "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
     )
     return driver
 
 
-def play_vod_in_seperate_thread(course: Course, vod: Vod, progress: Progress, headless: bool):
-    logger.info(f"playing vod: {vod.name} in a seperate thread, thread: {threading.current_thread().name}")
+def download_vod(vod: Vod, m3u8_link: str, filename: str) -> None:
+    from m3u8downloader.main import M3u8Downloader
+
+    logger.info("downloading vod: %s", vod.name)
+    downloader = M3u8Downloader(
+        m3u8_link, filename, tempdir=".", poolsize=DOWNLOAD_SEGMENT_POOLSIZE
+    )
+    downloader.start()
+
+
+def build_logged_in_driver(headless: bool = True):
     logger.debug("building driver...")
     driver = build_driver(headless=headless)
     logger.debug("doing login...")
-    do_login(driver, AUTH_INFO["username"], AUTH_INFO["password"])
-    logger.debug(f"completed login")
-    logger.debug(f"playing vod: {vod.name} at course {course.title}")
-    play_vod(driver, vod, course, progress)
-    logger.debug(f"completed playing vod: {vod.name}")
-    driver.close()
+    try:
+        do_login(driver, AUTH_INFO["username"], AUTH_INFO["password"])
+    except Exception:
+        _quit_driver(driver)
+        raise
+    logger.debug("completed login")
+    return driver
+
+
+def _quit_driver(driver) -> None:
+    # quit() rather than close(), so geckodriver and firefox exit as well
+    try:
+        driver.quit()
+    except Exception as e:
+        logger.warning("error while quitting driver: %s", e)
+
+
+class DriverPool:
+    """a fixed number of logged-in drivers, shared between worker threads"""
+
+    def __init__(self, size: int, headless: bool = True):
+        self.headless = headless
+        self._drivers: "queue.Queue" = queue.Queue()
+        # drivers owned by the pool, either queued or checked out
+        self._size = size
+        self._size_lock = threading.Lock()
+
+        # warm up all drivers at once, startup + login is the slow part
+        with ThreadPoolExecutor(
+            max_workers=size, thread_name_prefix="driver-pool-warmup"
+        ) as executor:
+            futures = [
+                executor.submit(build_logged_in_driver, headless) for _ in range(size)
+            ]
+
+        # wait for every build, so that no browser is left running if one of them failed
+        errors = [future.exception() for future in futures if future.exception()]
+        drivers = [future.result() for future in futures if not future.exception()]
+        if errors:
+            for driver in drivers:
+                _quit_driver(driver)
+            raise errors[0]
+
+        for driver in drivers:
+            self._drivers.put(driver)
+
+    def _get(self):
+        # poll, so that waiting workers notice when the last driver is lost
+        while True:
+            with self._size_lock:
+                if self._size == 0:
+                    raise RuntimeError("no drivers left in the pool")
+            try:
+                return self._drivers.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    @contextmanager
+    def checkout(self) -> Iterator:
+        driver = self._get()
+        try:
+            yield driver
+        except Exception:
+            # the browser may be in any state now, so replace it with a fresh one
+            logger.warning("discarding broken driver, building a new one")
+            _quit_driver(driver)
+            try:
+                replacement = build_logged_in_driver(self.headless)
+            except Exception as e:
+                with self._size_lock:
+                    self._size -= 1
+                    size = self._size
+                logger.error(
+                    "could not replace broken driver (%s), pool shrinks to %d", e, size
+                )
+            else:
+                self._drivers.put(replacement)
+            raise
+        else:
+            self._drivers.put(driver)
+
+    def close(self) -> None:
+        while not self._drivers.empty():
+            _quit_driver(self._drivers.get())
+
+
+def load_completed_vods() -> Dict[str, bool]:
+    if not os.path.exists(COMPLETED_VODS_FILE):
+        return {}
+
+    try:
+        with open(COMPLETED_VODS_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("ignoring unreadable %s: %s", COMPLETED_VODS_FILE, e)
+        return {}
+
+
+def mark_vod_completed(vod: Vod) -> None:
+    with _completed_vods_lock:
+        completed_vods = load_completed_vods()
+        completed_vods[vod.link] = True
+        # write to a temp file first, so a crash mid-write can't truncate the manifest
+        tmp_file = COMPLETED_VODS_FILE + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(completed_vods, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, COMPLETED_VODS_FILE)
+
+
+def play_vod_in_seperate_thread(course: Course, vod: Vod, progress: Progress, pool: DriverPool):
+    logger.info("playing vod: %s in a seperate thread, thread: %s", vod.name, threading.current_thread().name)
+    with pool.checkout() as driver:
+        logger.debug("playing vod: %s at course %s", vod.name, course.title)
+        play_vod(driver, vod, course, progress)
+        logger.debug("completed playing vod: %s", vod.name)
+    mark_vod_completed(vod)
 
 
 def main(
     headless: bool = True,
     max_threads: int = 2,
     download: bool = False,
+    replay_completed: bool = False,
 ):
     try:
-        result = subprocess.run(["pgrep -l firefox"], shell=True, check=True)
-        logger.info(f"finding running firefox instances...: {result.stdout}")
-        logger.info(f"killing all firefox instances...")
-        result = subprocess.run(["pkill firefox"], shell=True, check=True)
-        logger.info(f"result: {result.stdout}")
+        kill_previous_run_processes()
     except Exception as e:
-        logger.warning(f"error while killing firefox: {e}")
+        logger.warning("error while killing firefox: %s", e)
 
-    driver = build_driver(headless=headless)
-    logger.info("doing login...")
-    do_login(driver, AUTH_INFO["username"], AUTH_INFO["password"])
+    logger.info("building drivers and doing login...")
+    pool = DriverPool(max_threads, headless=headless)
     logger.info("completed login")
 
-    logger.info("getting all courses")
-    courses = get_all_courses(driver)
-
-    logger.info(f"found {len(courses)} courses")
-
-    for i in range(len(courses)):
-        course = courses[i]
-        logger.debug(f"\tcourse<{i}>: {course.title}")
-    
-    non_completed_vods: List[Vod] = []
-    all_vods: List[Vod] = []
-
-    for course in courses:
-        vods = get_all_vods_under_course(driver, course)
-        for vod in vods:
-            all_vods.append(vod)
-            if not vod.is_complete:
-                non_completed_vods.append(vod)
-
-    logger.info(f"found {len(non_completed_vods)} non-completed vods, and {len(all_vods)} vods in total")
-
-    if download:
-        for vod in all_vods:
-            logger.info(f"downloading vod: {vod.name}")
-            m3u8_link = _vod_get_video_m3u8_link(driver, vod)
-            filename = (
-                hashlib.md5((course.title + vod.name).encode()).hexdigest() + ".mp4"
-            )
-
-            if os.path.exists(filename):
-                logger.info(f"file already exists: {filename}")
-                continue
+    try:
+        logger.info("getting all courses")
+        with pool.checkout() as driver:
+            courses = get_all_courses(driver)
 
-            from m3u8downloader.main import M3u8Downloader
+        logger.info("found %d courses", len(courses))
 
-            downloader = M3u8Downloader(m3u8_link, filename, tempdir=".", poolsize=5)
-            downloader.start()
+        for i in range(len(courses)):
+            course = courses[i]
+            logger.debug("\tcourse<%d>: %s", i, course.title)
 
-    logger.info(f"closing driver")
-    driver.close()
+        completed_vods = {} if replay_completed else load_completed_vods()
+        non_completed_items: List[Tuple[Course, Vod]] = []
+        all_items: List[Tuple[Course, Vod]] = []
 
+        def scan_course(course: Course) -> List[Vod]:
+            with pool.checkout() as driver:
+                return get_all_vods_under_course(driver, course)
 
-    logger.info(f"start playing non-completed vods")
-    with Progress() as progress:
         with ThreadPoolExecutor(
-            max_workers=max_threads, thread_name_prefix="vod-streaming-thread"
+            max_workers=max_threads, thread_name_prefix="course-scanning-thread"
         ) as executor:
-            futures = []
-            for vod in non_completed_vods:
-                future = executor.submit(
-                    play_vod_in_seperate_thread, course, vod, progress, headless
+            for course, vods in zip(courses, executor.map(scan_course, courses)):
+                for vod in vods:
+                    all_items.append((course, vod))
+                    if not vod.is_complete and not completed_vods.get(vod.link):
+                        non_completed_items.append((course, vod))
+
+        logger.info("found %d non-completed vods, and %d vods in total", len(non_completed_items), len(all_items))
+
+        if download:
+            to_download: List[Tuple[Vod, str]] = []
+            for course, vod in all_items:
+                filename = (
+                    hashlib.md5((course.title + vod.name).encode()).hexdigest()
+                    + ".mp4"
                 )
-                futures.append(future)
 
-            for future in futures:
-                future.result()
+                if os.path.exists(filename):
+                    logger.info("file already exists: %s", filename)
+                    continue
+
+                to_download.append((vod, filename))
+
+            def get_m3u8_link(vod: Vod) -> Optional[str]:
+                with pool.checkout() as driver:
+                    try:
+                        return _vod_get_video_m3u8_link(driver, vod)
+                    except TimeoutException:
+                        # the page has no player, the driver itself is still fine
+                        return None
+
+            # links are extracted on the drivers, each download starts as soon as its link is known
+            with ThreadPoolExecutor(
+                max_workers=max_threads, thread_name_prefix="m3u8-link-thread"
+            ) as link_executor, ThreadPoolExecutor(
+                max_workers=DOWNLOAD_THREADS, thread_name_prefix="vod-download-thread"
+            ) as download_executor:
+                link_futures = {
+                    link_executor.submit(get_m3u8_link, vod): (vod, filename)
+                    for vod, filename in to_download
+                }
+
+                download_futures = []
+                for link_future in as_completed(link_futures):
+                    vod, filename = link_futures[link_future]
+                    try:
+                        m3u8_link = link_future.result()
+                    except Exception as e:
+                        logger.warning("skipping vod %s, failed to get its m3u8 link: %s", vod.name, e)
+                        continue
+                    if m3u8_link is None:
+                        logger.warning("skipping vod %s, no video found on its page", vod.name)
+                        continue
+
+                    download_futures.append(
+                        download_executor.submit(download_vod, vod, m3u8_link, filename)
+                    )
+
+                for future in download_futures:
+                    future.result()
+
+        logger.info("start playing non-completed vods")
+        with Progress() as progress:
+            with ThreadPoolExecutor(
+                max_workers=max_threads, thread_name_prefix="vod-streaming-thread"
+            ) as executor:
+                futures = []
+                for course, vod in non_completed_items:
+                    future = executor.submit(
+                        play_vod_in_seperate_thread, course, vod, progress, pool
+                    )
+                    futures.append(future)
+
+                for future in futures:
+                    future.result()
+    finally:
+        logger.info("closing drivers")
+        pool.close()
 
 
 if __name__ == "__main__":
@@ -356,6 +668,12 @@ if __name__ == "__main__":
         help="download the vods instead of playing them",
     )
 
+    parser.add_argument(
+        "--replay-completed",
+        action="store_true",
+        help=f"also play vods already recorded as played in {COMPLETED_VODS_FILE}",
+    )
+
     args = parser.parse_args()
 
     try:
@@ -363,9 +681,10 @@ if __name__ == "__main__":
             headless=args.headless,
             max_threads=args.max_threads,
             download=args.download,
+            replay_completed=args.replay_completed,
         )
-        os.system("pkill firefox")
     except KeyboardInterrupt as e:
         logger.info("exiting...")
-        os.system("pkill firefox")
         raise e
+    finally:
+        kill_spawned_processes()